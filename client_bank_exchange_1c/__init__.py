@@ -8,5 +8,5 @@ __version__ = '0.1.8'
 
 from .client_bank_exchange_1c import (
     Statement, Header, Balance, Document, Payer, Payment, Receipt, Receiver,
-    Special, Tax,
+    Special, Tax, DocumentTable, Kopecks,
 )
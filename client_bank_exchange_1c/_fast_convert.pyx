@@ -0,0 +1,93 @@
+# cython: language_level=3
+"""
+Cython-версия переноса значений платежного документа в поля Django-модели, подключается
+в django_client_bank_exchange_1c.py при наличии собранного расширения
+"""
+
+
+cpdef dict build_document_kwargs(object document):
+    """
+    Значения полей DjangoDocument из платежного документа
+
+    :param document: платежный документ
+    :return: словарь {поле модели: значение}
+    """
+    cdef object receipt = document.receipt
+    cdef object payer = document.payer
+    cdef object receiver = document.receiver
+    cdef object payment = document.payment
+    cdef object tax = document.tax
+    cdef object special = document.special
+
+    return {
+        'document_type': document.document_type,
+        'number': document.number,
+        'date': document.date,
+        'amount': document.amount,
+
+        'receipt_date': receipt.date,
+        'receipt_time': receipt.time,
+        'receipt_content': receipt.content,
+
+        'payer_account': payer.account,
+        'payer_date_charged': payer.date_charged,
+        'payer_name': payer.name,
+        'payer_inn': payer.inn,
+        'payer_l1_name': payer.l1_name,
+        'payer_l2_account_number': payer.l2_account_number,
+        'payer_l3_bank': payer.l3_bank,
+        'payer_l4_city': payer.l4_city,
+        'payer_account_number': payer.account_number,
+        'payer_bank_1_name': payer.bank_1_name,
+        'payer_bank_2_city': payer.bank_2_city,
+        'payer_bank_bic': payer.bank_bic,
+        'payer_bank_corr_account': payer.bank_corr_account,
+
+        'receiver_account': receiver.account,
+        'receiver_date_received': receiver.date_received,
+        'receiver_name': receiver.name,
+        'receiver_inn': receiver.inn,
+        'receiver_l1_name': receiver.l1_name,
+        'receiver_l2_account_number': receiver.l2_account_number,
+        'receiver_l3_bank': receiver.l3_bank,
+        'receiver_l4_city': receiver.l4_city,
+        'receiver_account_number': receiver.account_number,
+        'receiver_bank_1_name': receiver.bank_1_name,
+        'receiver_bank_2_city': receiver.bank_2_city,
+        'receiver_bank_bic': receiver.bank_bic,
+        'receiver_bank_corr_account': receiver.bank_corr_account,
+
+        'payment_payment_type': payment.payment_type,
+        'payment_operation_type': payment.operation_type,
+        'payment_code': payment.code,
+        'payment_purpose': payment.purpose,
+        'payment_purpose_l1': payment.purpose_l1,
+        'payment_purpose_l2': payment.purpose_l2,
+        'payment_purpose_l3': payment.purpose_l3,
+        'payment_purpose_l4': payment.purpose_l4,
+        'payment_purpose_l5': payment.purpose_l5,
+        'payment_purpose_l6': payment.purpose_l6,
+
+        'tax_originator_status': tax.originator_status,
+        'tax_payer_kpp': tax.payer_kpp,
+        'tax_receiver_kpp': tax.receiver_kpp,
+        'tax_kbk': tax.kbk,
+        'tax_okato': tax.okato,
+        'tax_basis': tax.basis,
+        'tax_period': tax.period,
+        'tax_number': tax.number,
+        'tax_date': tax.date,
+        'tax_type': tax.type,
+
+        'special_priority': special.priority,
+        'special_term_of_acceptance': special.term_of_acceptance,
+        'special_letter_of_credit_type': special.letter_of_credit_type,
+        'special_maturity': special.maturity,
+        'special_payment_condition_1': special.payment_condition_1,
+        'special_payment_condition_2': special.payment_condition_2,
+        'special_payment_condition_3': special.payment_condition_3,
+        'special_by_submission': special.by_submission,
+        'special_extra_conditions': special.extra_conditions,
+        'special_supplier_account_number': special.supplier_account_number,
+        'special_docs_sent_date': special.docs_sent_date,
+    }
@@ -0,0 +1,32 @@
+# cython: language_level=3
+"""
+Cython-версия разбора строк секции, подключается в client_bank_exchange_1c.py при наличии собранного расширения
+"""
+
+
+cpdef dict build_line_index(str section_text):
+    """
+    Разбирает текст секции на строки *ключ=значение* за один проход
+
+    :param section_text: текст секции
+    :return: словарь {ключ: [значения всех строк с этим ключом]}
+    """
+    cdef dict line_index = {}
+    cdef list values
+    cdef str line, key
+    cdef Py_ssize_t separator
+
+    for line in section_text.splitlines():
+        separator = line.find('=')
+        # строки без "=" (признаки Type.FLAG) значения не несут
+        if separator < 0:
+            continue
+
+        key = line[:separator]
+        values = line_index.get(key)
+        if values is None:
+            line_index[key] = [line[separator + 1:]]
+        else:
+            values.append(line[separator + 1:])
+
+    return line_index
@@ -1,12 +1,38 @@
+import mmap
+import os
 import re
+from collections import defaultdict
 from decimal import Decimal
 from datetime import date, time, datetime
 from enum import Flag, auto, Enum
-from functools import reduce
-from typing import NamedTuple, List, Callable, Pattern, AnyStr, Any, Optional
+from typing import NamedTuple, List, Callable, Pattern, AnyStr, Any, Optional, Iterable, Iterator, Tuple
 
 DATE_FORMAT = '%d.%m.%Y'
 TIME_FORMAT = '%H:%M:%S'
+ENCODING = 'cp1251'
+
+# признаки секций в кодировке файла для поиска без декодирования
+_SENTINELS = {
+    'header_end': 'Секция'.encode(ENCODING),
+    'balance_begin': 'СекцияРасчСчет'.encode(ENCODING),
+    'balance_end': 'КонецРасчСчет'.encode(ENCODING),
+    'doc_begin': 'СекцияДокумент'.encode(ENCODING),
+    'doc_end': 'КонецДокумента'.encode(ENCODING),
+    'file_end': 'КонецФайла'.encode(ENCODING),
+}
+
+
+class _AmountTranslation(dict):
+    """
+    Таблица для str.translate: символы, которых нет в таблице, удаляются
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+# оставляет цифры и минус, запятую приводит к точке
+AMOUNT_TRANSLATION = _AmountTranslation(str.maketrans('0123456789-,.', '0123456789-..'))
 
 
 class Required(Flag):
@@ -22,6 +48,83 @@ class FieldType(NamedTuple):
     cast_to_text: Callable
 
 
+class Kopecks(int):
+    """
+    Сумма в копейках. Все суммы 1CClientBankExchange имеют ровно два знака после запятой, поэтому целое число
+    копеек точно представляет сумму, а арифметика над int значительно дешевле, чем над Decimal.
+
+    Сложение, вычитание, смена знака и модуль возвращают Kopecks, int в них считается копейками: результат
+    не превращается в int, который записывался бы в файл как рубли
+
+    >>> Kopecks(10025) + 100, 100 - Kopecks(10025), -Kopecks(5), abs(Kopecks(-5)), sum([Kopecks(1), Kopecks(2)])
+    (Kopecks(10125), Kopecks(-9925), Kopecks(-5), Kopecks(5), Kopecks(3))
+    >>> text = 'СекцияДокумент=Платежное поручение\\nСумма=100.25\\nКонецДокумента'
+    >>> document = Document.from_text(text, fast_amounts=True)[0]
+    >>> document.amount = document.amount + 100
+    >>> [line for line in document.to_lines(validate=False) if line.startswith('Сумма')]
+    ['Сумма=101.25']
+    """
+
+    __slots__ = ()
+
+    def __add__(self, other):
+        result = int.__add__(self, other)
+        return result if result is NotImplemented else Kopecks(result)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        result = int.__sub__(self, other)
+        return result if result is NotImplemented else Kopecks(result)
+
+    def __rsub__(self, other):
+        result = int.__rsub__(self, other)
+        return result if result is NotImplemented else Kopecks(result)
+
+    def __neg__(self):
+        return Kopecks(-int(self))
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Kopecks(abs(int(self)))
+
+    def __repr__(self):
+        return f'Kopecks({int(self)})'
+
+    def __str__(self):
+        # у int нет собственного __str__, без него str() и f-строки выводили бы repr
+        return Cast.kopecks_to_str(self)
+
+    def to_decimal(self) -> Decimal:
+        """
+        :return: сумма в рублях
+        """
+        return Decimal(int(self)).scaleb(-2)
+
+
+def sum_amounts(amounts: Iterable[Any]):
+    """
+    Сумма платежей без смешения единиц: Kopecks складываются как копейки, остальные суммы (Decimal) как рубли,
+    пустые суммы пропускаются
+
+    :param amounts: суммы Kopecks, Decimal или None
+    :return: Kopecks, если все суммы в Kopecks, иначе Decimal; для пустого набора Decimal(0)
+    """
+    kopecks = None
+    rubles = None
+    for amount in amounts:
+        if isinstance(amount, Kopecks):
+            kopecks = int(amount) if kopecks is None else kopecks + int(amount)
+        elif amount is not None:
+            rubles = amount if rubles is None else rubles + amount
+
+    if rubles is None:
+        return Decimal(0) if kopecks is None else Kopecks(kopecks)
+    return rubles if kopecks is None else rubles + Kopecks(kopecks).to_decimal()
+
+
 class Cast:
     @staticmethod
     def str_to_text(obj: AnyStr) -> Optional[str]:
@@ -31,10 +134,10 @@ class Cast:
         :param obj: строка
         :return: строка или None
         """
-        if obj and obj.strip():
-            return obj.strip()
-        else:
+        if obj is None:
             return None
+        obj = obj.strip()
+        return obj if obj else None
 
     @staticmethod
     def str_to_date(obj: AnyStr) -> Optional[date]:
@@ -44,10 +147,12 @@ class Cast:
         :param obj: строка в формате *дд.мм.гггг*
         :return: datetime.date
         """
-        if obj:
-            return datetime.strptime(obj, DATE_FORMAT).date()
-        else:
+        if not obj:
             return None
+        elif len(obj) == 10 and obj[2] == '.' and obj[5] == '.':
+            return date(int(obj[6:10]), int(obj[3:5]), int(obj[0:2]))
+        else:
+            return datetime.strptime(obj, DATE_FORMAT).date()
 
     @staticmethod
     def str_to_time(obj: AnyStr) -> Optional[time]:
@@ -57,10 +162,12 @@ class Cast:
         :param obj: строка в формате *чч:мм:сс*
         :return: datetime.time
         """
-        if obj:
-            return datetime.strptime(obj, TIME_FORMAT).time()
-        else:
+        if not obj:
             return None
+        elif len(obj) == 8 and obj[2] == ':' and obj[5] == ':':
+            return time(int(obj[0:2]), int(obj[3:5]), int(obj[6:8]))
+        else:
+            return datetime.strptime(obj, TIME_FORMAT).time()
 
     @staticmethod
     def str_to_amount(obj: AnyStr) -> Decimal:
@@ -70,13 +177,34 @@ class Cast:
         :param obj: строка в формате руб[.коп]
         :return: decimal.Decimal
         """
-        return Decimal(
-            re.sub(r'[^0-9,.\-]', '', str(obj))
-                .replace("'", '')
-                .replace(' ', '')
-                .replace(',', '.')
-                .replace('.', '', obj.count('.') - 1)
-        )
+        amount = str(obj).translate(AMOUNT_TRANSLATION)
+        if amount.count('.') > 1:
+            # все разделители кроме последнего считаются разделителями разрядов
+            integer, _, fraction = amount.rpartition('.')
+            amount = integer.replace('.', '') + '.' + fraction
+        return Decimal(amount)
+
+    @staticmethod
+    def str_to_amount_kopecks(obj: AnyStr) -> Kopecks:
+        """
+        Конвертирует строку из 1CClientBankExchange в целое число копеек
+
+        :param obj: строка в формате руб[.коп]
+        :return: Kopecks
+        """
+        amount = str(obj).translate(AMOUNT_TRANSLATION)
+        integer, separator, fraction = amount.rpartition('.')
+        if not separator:
+            integer, fraction = fraction, ''
+
+        if not integer and not fraction:
+            raise ValueError(f'Строка {obj!r} не содержит суммы')
+        if fraction[2:].strip('0'):
+            raise ValueError(f'Сумма {obj!r} содержит больше двух знаков после запятой')
+
+        negative = integer.startswith('-')
+        kopecks = int(integer.replace('.', '').lstrip('-') or '0') * 100 + int((fraction + '00')[:2])
+        return Kopecks(-kopecks if negative else kopecks)
 
     @staticmethod
     def text_to_str(obj: AnyStr) -> str:
@@ -100,7 +228,7 @@ class Cast:
         :return: строка в формате *дд.мм.гггг*
         """
         if obj:
-            return obj.strftime(DATE_FORMAT)
+            return f'{obj.day:02d}.{obj.month:02d}.{obj.year:04d}'
         else:
             return ''
 
@@ -113,7 +241,7 @@ class Cast:
         :return: строка в формате *чч:мм:сс*
         """
         if obj:
-            return obj.strftime(TIME_FORMAT)
+            return f'{obj.hour:02d}:{obj.minute:02d}:{obj.second:02d}'
         else:
             return ''
 
@@ -125,7 +253,23 @@ class Cast:
         :param obj: decimal.Decimal
         :return: строка в формате руб[.коп]
         """
-        return str(obj).replace(',', '.')
+        if isinstance(obj, Kopecks):
+            return Cast.kopecks_to_str(obj)
+        return str(obj)
+
+    @staticmethod
+    def kopecks_to_str(obj: Optional[int]) -> str:
+        """
+        Конвертирует целое число копеек в строку
+
+        :param obj: Kopecks или int
+        :return: строка в формате руб.коп
+        """
+        if obj is None:
+            return ''
+        sign = '-' if obj < 0 else ''
+        obj = abs(obj)
+        return f'{sign}{obj // 100}.{obj % 100:02d}'
 
 
 class Type(Enum):
@@ -133,45 +277,238 @@ class Type(Enum):
     DATE = FieldType(type=date, cast_from_text=Cast.str_to_date, cast_to_text=Cast.date_to_str)
     TIME = FieldType(type=time, cast_from_text=Cast.str_to_time, cast_to_text=Cast.time_to_str)
     AMOUNT = FieldType(type=Decimal, cast_from_text=Cast.str_to_amount, cast_to_text=Cast.amount_to_str)
+    AMOUNT_KOPECKS = FieldType(type=Kopecks, cast_from_text=Cast.str_to_amount_kopecks,
+                               cast_to_text=Cast.kopecks_to_str)
     ARRAY = FieldType(type=List[str], cast_from_text=Cast.str_to_text, cast_to_text=Cast.text_to_str)
     FLAG = FieldType(type=type(None), cast_from_text=Cast.str_to_text, cast_to_text=Cast.text_to_str)
 
 
-class Field(NamedTuple):
-    key: str
-    description: str
-    required: Required = Required.NONE
-    type: Type = Type.TEXT
+# noinspection PyShadowingBuiltins
+class Field:
+    """
+    Поле секции: ключ в файле 1CClientBankExchange, описание, обязательность и тип значения.
+    Regex для поиска значения и функции приведения типа вычисляются один раз при создании поля
+    """
+
+    __slots__ = ('key', 'description', 'required', 'type', 'regex', 'cast_from_text', 'cast_to_text')
+
+    def __init__(self, key: str, description: str, required: Required = Required.NONE, type: Type = Type.TEXT):
+        self.key = key
+        self.description = description
+        self.required = required
+        self.type = type
+        self.regex: Pattern[str] = re.compile(r'^' + re.escape(key) + r'=(.*?)$', re.MULTILINE)
+        self.cast_from_text: Callable = type.value.cast_from_text
+        self.cast_to_text: Callable = type.value.cast_to_text
+
+    def __repr__(self):
+        return f'Field(key={self.key!r}, description={self.description!r}, required={self.required}, ' \
+               f'type={self.type})'
 
     def get_value_from_text(self, source_text: AnyStr) -> Any:
-        regex = r'^' + self.key + '=(.*?)$'
-        found = re.findall(regex, source_text, re.MULTILINE)
+        return self.get_value_from_lines(self.regex.findall(source_text))
+
+    def get_value_from_lines(self, found: List[str], fast_amounts=False) -> Any:
+        """
+        Приводит найденные в секции строковые значения поля к типу поля
 
+        :param found: значения всех строк секции с ключом поля
+        :param fast_amounts: разбирать Type.AMOUNT как Type.AMOUNT_KOPECKS
+        :return: значение поля, список значений для Type.ARRAY или None
+        """
         if len(found) > 1 and self.type != Type.ARRAY:
             raise ValueError(f'Согласно спецификации {self.key} не может быть несколькими строками, однако найдено '
                              f'{len(found)} шт.')
 
         if not found:
             return None
-        elif self.type == Type.ARRAY and len(found) > 1:
-            return [self.type.value.cast_from_text(item) for item in found]
+        elif self.type == Type.ARRAY:
+            return [self.cast_from_text(item) for item in found]
+        elif fast_amounts and self.type == Type.AMOUNT:
+            return Type.AMOUNT_KOPECKS.value.cast_from_text(found[0])
         else:
-            return self.type.value.cast_from_text(found[0])
+            return self.cast_from_text(found[0])
 
 
 class Schema:
     @classmethod
     def to_dict(cls) -> dict:
-        return {
-            attr: getattr(cls, attr)
-            for attr in cls.__dict__.keys() if not attr.startswith("__")
-        }
+        """
+        Поля схемы в порядке объявления, вычисляются один раз и хранятся на конкретном классе схемы
+
+        :return: словарь {имя аттрибута: поле}
+        """
+        fields = cls.__dict__.get('_fields')
+        if fields is None:
+            fields = {
+                attr: getattr(cls, attr)
+                for attr in cls.__dict__.keys() if not attr.startswith("_")
+            }
+            cls._fields = fields
+        return fields
+
+    @classmethod
+    def keys(cls) -> Tuple[str, ...]:
+        """
+        Ключи полей схемы в файле 1CClientBankExchange, вычисляются один раз и хранятся на конкретном классе схемы
+
+        :return: кортеж ключей
+        """
+        keys = cls.__dict__.get('_keys')
+        if keys is None:
+            keys = tuple(field.key for field in cls.to_dict().values())
+            cls._keys = keys
+        return keys
+
+    @classmethod
+    def emit_plan(cls) -> List[tuple]:
+        """
+        План вывода полей схемы в текст, вычисляется один раз и хранится на конкретном классе схемы
+
+        :return: список (имя аттрибута, ключ, признак FLAG, признак ARRAY, функция вывода, обязательно в банк)
+        """
+        plan = cls.__dict__.get('_emit_plan')
+        if plan is None:
+            plan = [
+                (attr, field.key, field.type == Type.FLAG, field.type == Type.ARRAY, field.cast_to_text,
+                 Required.TO_BANK in field.required)
+                for attr, field in cls.to_dict().items()
+            ]
+            cls._emit_plan = plan
+        return plan
+
+
+def build_line_index(section_text: AnyStr) -> dict:
+    """
+    Разбирает текст секции на строки *ключ=значение* за один проход
+
+    :param section_text: текст секции
+    :return: словарь {ключ: [значения всех строк с этим ключом]}
+    """
+    line_index = defaultdict(list)
+    for line in section_text.splitlines():
+        key, separator, value = line.partition('=')
+        # строки без "=" (признаки Type.FLAG) значения не несут
+        if separator:
+            line_index[key].append(value)
+    return line_index
+
+
+try:
+    # собранное расширение с той же функцией, см. _fastparse.pyx
+    from ._fastparse import build_line_index
+except ImportError:
+    pass
+
+
+def iter_spans(source: AnyStr, begin: AnyStr, end: AnyStr, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Находит секции, ограниченные признаками начала и конца; работает как для str, так и для bytes
+
+    :param source: текст, в котором ищутся секции
+    :param begin: признак начала секции, входит в секцию
+    :param end: признак конца секции, в секцию не входит
+    :param start: позиция, с которой начинается поиск
+    :return: итератор пар (начало, конец) для срезов source
+    """
+    while True:
+        begin_at = source.find(begin, start)
+        if begin_at < 0:
+            return
+        end_at = source.find(end, begin_at + len(begin))
+        if end_at < 0:
+            return
+        yield begin_at, end_at
+        start = end_at + len(end)
+
+
+def _section_spans_bytes(buffer: bytes) -> Tuple[Tuple[int, int], Optional[Tuple[int, int]]]:
+    """
+    Находит границы заголовка и секции остатков в байтах файла до декодирования: cp1251 однобайтовая, поэтому
+    смещения в байтах совпадают со смещениями в символах. Документы см. _iter_document_spans_bytes
+
+    :param buffer: содержимое файла (bytes или mmap)
+    :return: (заголовок, содержимое секции остатков или None) как пары (начало, конец)
+    """
+    file_end = buffer.rfind(_SENTINELS['file_end'])
+    if file_end < 0:
+        file_end = len(buffer)
+
+    header_end = buffer.find(_SENTINELS['header_end'], 0, file_end)
+    header_span = (0, header_end if header_end >= 0 else file_end)
+
+    balance_span = None
+    for start, stop in iter_spans(buffer, _SENTINELS['balance_begin'], _SENTINELS['balance_end']):
+        if stop <= file_end:
+            balance_span = (start + len(_SENTINELS['balance_begin']), stop)
+        break
+
+    return header_span, balance_span
+
+
+def _iter_document_spans_bytes(buffer: bytes) -> Iterator[Tuple[int, int]]:
+    """
+    Генератор границ секций документов в байтах файла, секции после КонецФайла не учитываются
+
+    :param buffer: содержимое файла (bytes или mmap)
+    :return: итератор пар (начало, конец)
+    """
+    file_end = buffer.rfind(_SENTINELS['file_end'])
+    for start, stop in iter_spans(buffer, _SENTINELS['doc_begin'], _SENTINELS['doc_end']):
+        # секции идут по возрастанию смещений, все следующие тоже окажутся за концом файла
+        if 0 <= file_end < stop:
+            return
+        yield start, stop
+
+
+def _make_section_init(cls) -> Callable:
+    """
+    Генерирует конструктор секции по __slots__ класса и его предков (сначала аттрибуты предков): именованные
+    параметры со значением None по умолчанию и прямое присваивание каждого аттрибута, без разбора *args/**kwargs
+    при каждом вызове
+
+    :param cls: класс секции с заполненными __slots__
+    :return: функция __init__ с аннотациями типов полей
+    """
+    attrs = [attr for klass in reversed(cls.__mro__) for attr in klass.__dict__.get('__slots__', ())]
+    source = 'def __init__(self, {}):\n{}'.format(
+        ', '.join(f'{attr}=None' for attr in attrs),
+        '\n'.join(f'    self.{attr} = {attr}' for attr in attrs)
+    )
+    namespace = {}
+    exec(source, namespace)
+
+    init = namespace['__init__']
+    init.__qualname__ = f'{cls.__qualname__}.__init__'
+    init.__module__ = cls.__module__
+    types = {
+        # значение признака Type.FLAG при создании секции вручную передается строкой, разбор всегда дает None
+        attr: str if field.type == Type.FLAG else field.type.value.type
+        for attr, field in cls.Schema.to_dict().items()
+    }
+    subsections = getattr(cls, 'Subsections', None)
+    if subsections:
+        types.update(subsections.to_dict())
+    init.__annotations__ = {attr: Optional[types[attr]] for attr in attrs if attr in types}
+    return init
 
 
 class Section:
+    """
+    Базовая секция: аттрибуты объявляются в __slots__ наследников в порядке полей схемы, конструктор с
+    именованными параметрами генерируется по ним при создании класса, см. _make_section_init
+    """
+
+    __slots__ = ()
+
     class Meta(NamedTuple):
         regex: Pattern[str] = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__dict__.get('__slots__') and '__init__' not in cls.__dict__:
+            cls.__init__ = _make_section_init(cls)
+
     @classmethod
     def extract_section_text(cls, source_text: AnyStr):
         regex = cls.Meta.regex
@@ -187,52 +524,53 @@ class Section:
                 return result
 
     @classmethod
-    def from_text(cls, section_text):
-        obj = cls()
-        for key, field in cls.Schema.to_dict().items():
-            value = field.get_value_from_text(section_text)
-            setattr(obj, key, value)
+    def from_text(cls, section_text, fast_amounts=False):
+        return cls.from_line_index(build_line_index(section_text), fast_amounts=fast_amounts)
+
+    @classmethod
+    def from_line_index(cls, line_index: dict, fast_amounts=False):
+        """
+        Конструктор секции из заранее разобранных строк, см. build_line_index
+
+        :param line_index: словарь {ключ: [значения]}
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: Заполненный объект секции
+        """
+        # все аттрибуты схемы заполняются ниже, конструктор с None по умолчанию не нужен
+        obj = cls.__new__(cls)
+        for attr, field in cls.Schema.to_dict().items():
+            setattr(obj, attr, field.get_value_from_lines(line_index.get(field.key, []), fast_amounts))
         return obj
 
     def to_text(self, validate=True):
+        return '\n'.join(self.to_lines(validate=validate))
 
-        # noinspection PyShadowingNames
-        def get_text(key, field, attr):
-            # noinspection PyShadowingNames
-            def get_line(key, field, attr):
-                is_flag = field.type == Type.FLAG
-                name = field.key
-                value = field.type.value.cast_to_text(attr)
-                required = Required.TO_BANK in field.required
-                if not required and not value:
-                    return ''
-                else:
-                    return f'{name}' if is_flag else f'{name}={value}'
-
-            if attr and field.type == Type.ARRAY:
-                lines = [get_line(key, field, item) for item in attr]
-                return '\n'.join(lines) if lines else ''
+    def to_lines(self, result: List[str] = None, validate=True) -> List[str]:
+        """
+        Дописывает строки секции в переданный список, чтобы вся выписка собиралась одним join
+
+        :param result: список строк, который нужно дополнить; если не передан, создается новый
+        :param validate: проверять заполненность обязательных при отправке в банк аттрибутов
+        :return: дополненный список строк
+        """
+        if result is None:
+            result = []
+
+        for attr, key, is_flag, is_array, cast_to_text, required in self.__class__.Schema.emit_plan():
+            value = getattr(self, attr, None)
+            if is_array and value:
+                for item in value:
+                    text = cast_to_text(item)
+                    if required or text:
+                        result.append(key if is_flag else f'{key}={text}')
             else:
-                return get_line(key, field, attr)
-
-        # noinspection PyShadowingNames
-        def validate_attr(key, field, attr):
-            is_flag = field.type == Type.FLAG
-            name = field.key
-            value = field.type.value.cast_to_text(attr)
-            required = Required.TO_BANK in field.required
-            if required and not is_flag and not value:
-                raise ValueError(f'Обязательны при отправке в банк аттрибут {name} не содержит значения!')
-
-        result = []
-        for key, field in self.__class__.Schema.to_dict().items():
-            attr = getattr(self, key, None)
-            if validate:
-                validate_attr(key, field, attr)
-            text = get_text(key, field, attr)
-            result.append(text)
-
-        return '\n'.join(filter(lambda x: x != '', result))
+                text = cast_to_text(value)
+                if validate and required and not is_flag and not text:
+                    raise ValueError(f'Обязательны при отправке в банк аттрибут {key} не содержит значения!')
+                if required or text:
+                    result.append(key if is_flag else f'{key}={text}')
+
+        return result
 
     def __str__(self):
         return self.to_text(validate=False)
@@ -260,28 +598,18 @@ class Header(Section):
         filter_account_numbers = Field('РасчСчет', 'Расчетный счет организации', Required.BOTH, type=Type.ARRAY)
         filter_document_types = Field('Документ', 'Вид документа', type=Type.ARRAY)
 
-    def __init__(self, format_name: str = None, format_version: str = None, encoding: str = None, sender: str = None,
-                 receiver: str = None, creation_date: Type.DATE.value.type = None,
-                 creation_time: Type.TIME.value.type = None, filter_date_since: Type.DATE.value.type = None,
-                 filter_date_till: Type.DATE.value.type = None, filter_account_numbers: Type.ARRAY.value.type = None,
-                 filter_document_types: Type.ARRAY.value.type = None):
-        super(Header, self).__init__()
-        self.format_name = format_name
-        self.format_version = format_version
-        self.encoding = encoding
-        self.sender = sender
-        self.receiver = receiver
-        self.creation_date = creation_date
-        self.creation_time = creation_time
-        self.filter_date_since = filter_date_since
-        self.filter_date_till = filter_date_till
-        self.filter_account_numbers = filter_account_numbers
-        self.filter_document_types = filter_document_types
+    __slots__ = tuple(Schema.to_dict())
+
+    @classmethod
+    def extract_section_text(cls, source_text: AnyStr):
+        # Meta.regex оставлен для совместимости: заголовок - все, что до первой секции
+        end = source_text.find('Секция')
+        return source_text[:end] if end >= 0 else source_text
 
     @classmethod
-    def from_text(cls, source_text):
+    def from_text(cls, source_text, fast_amounts=False):
         section_text = cls.extract_section_text(source_text)
-        return super().from_text(section_text)
+        return super().from_text(section_text, fast_amounts=fast_amounts)
 
 
 class Balance(Section):
@@ -303,30 +631,26 @@ class Balance(Section):
         final_balance = Field('КонечныйОстаток', 'Конечный остаток', type=Type.AMOUNT)
         tag_end = Field('КонецРасчСчет', 'Признак окончания секции', type=Type.FLAG)
 
-    def __init__(self, tag_begin: str = None, date_since: Type.DATE.value.type = None,
-                 date_till: Type.DATE.value.type = None, account_number: str = None,
-                 initial_balance: Type.AMOUNT.value.type = None, total_income: Type.AMOUNT.value.type = None,
-                 total_expense: Type.AMOUNT.value.type = None, final_balance: Type.AMOUNT.value.type = None,
-                 tag_end: str = None):
-        super(Balance, self).__init__()
-        self.tag_begin = tag_begin
-        self.date_since = date_since
-        self.date_till = date_till
-        self.account_number = account_number
-        self.initial_balance = initial_balance
-        self.total_income = total_income
-        self.total_expense = total_expense
-        self.final_balance = final_balance
-        self.tag_end = tag_end
+    __slots__ = tuple(Schema.to_dict())
 
-    def to_text(self, validate=True):
-        content = super(Balance, self).to_text(validate=validate)
-        return f'СекцияРасчСчет\n{content}\nКонецРасчСчет'
+    def to_lines(self, result: List[str] = None, validate=True) -> List[str]:
+        if result is None:
+            result = []
+        result.append('СекцияРасчСчет')
+        super(Balance, self).to_lines(result, validate=validate)
+        result.append('КонецРасчСчет')
+        return result
 
     @classmethod
-    def from_text(cls, source_text):
+    def extract_section_text(cls, source_text: AnyStr):
+        # Meta.regex оставлен для совместимости
+        for start, stop in iter_spans(source_text, 'СекцияРасчСчет', 'КонецРасчСчет'):
+            return source_text[start + len('СекцияРасчСчет'):stop]
+
+    @classmethod
+    def from_text(cls, source_text, fast_amounts=False):
         section_text = cls.extract_section_text(source_text)
-        return super().from_text(section_text)
+        return super().from_text(section_text, fast_amounts=fast_amounts) if section_text is not None else None
 
 
 class Receipt(Section):
@@ -339,12 +663,7 @@ class Receipt(Section):
         time = Field('КвитанцияВремя', 'Время формирования квитанции', type=Type.TIME)
         content = Field('КвитанцияСодержание', 'Содержание квитанции')
 
-    # noinspection PyShadowingNames
-    def __init__(self, date: Type.DATE.value.type = None, time: Type.TIME.value.type = None, content: str = None):
-        super(Receipt, self).__init__()
-        self.date = date
-        self.time = time
-        self.content = content
+    __slots__ = tuple(Schema.to_dict())
 
 
 class Payer(Section):
@@ -370,24 +689,7 @@ class Payer(Section):
         bank_bic = Field('ПлательщикБИК', 'БИК банка плательщика', Required.TO_BANK)
         bank_corr_account = Field('ПлательщикКорсчет', 'Корсчет банка плательщика', Required.TO_BANK)
 
-    def __init__(self, account: str = None, date_charged: Type.DATE.value.type = None, name: str = None,
-                 inn: str = None, l1_name: str = None, l2_account_number: str = None, l3_bank: str = None,
-                 l4_city: str = None, account_number: str = None, bank_1_name: str = None, bank_2_city: str = None,
-                 bank_bic: str = None, bank_corr_account: str = None):
-        super(Payer, self).__init__()
-        self.account = account
-        self.date_charged = date_charged
-        self.name = name
-        self.inn = inn
-        self.l1_name = l1_name
-        self.l2_account_number = l2_account_number
-        self.l3_bank = l3_bank
-        self.l4_city = l4_city
-        self.account_number = account_number
-        self.bank_1_name = bank_1_name
-        self.bank_2_city = bank_2_city
-        self.bank_bic = bank_bic
-        self.bank_corr_account = bank_corr_account
+    __slots__ = tuple(Schema.to_dict())
 
 
 class Receiver(Section):
@@ -413,24 +715,7 @@ class Receiver(Section):
         bank_bic = Field('ПолучательБИК', 'БИК банка получателя', Required.TO_BANK)
         bank_corr_account = Field('ПолучательКорсчет', 'Корсчет банка получателя', Required.TO_BANK)
 
-    def __init__(self, account: str = None, date_received: str = None, name: str = None, inn: str = None,
-                 l1_name: str = None, l2_account_number: str = None, l3_bank: str = None, l4_city: str = None,
-                 account_number: str = None, bank_1_name: str = None, bank_2_city: str = None, bank_bic: str = None,
-                 bank_corr_account: str = None):
-        super(Receiver, self).__init__()
-        self.account = account
-        self.date_received = date_received
-        self.name = name
-        self.inn = inn
-        self.l1_name = l1_name
-        self.l2_account_number = l2_account_number
-        self.l3_bank = l3_bank
-        self.l4_city = l4_city
-        self.account_number = account_number
-        self.bank_1_name = bank_1_name
-        self.bank_2_city = bank_2_city
-        self.bank_bic = bank_bic
-        self.bank_corr_account = bank_corr_account
+    __slots__ = tuple(Schema.to_dict())
 
 
 class Payment(Section):
@@ -453,20 +738,7 @@ class Payment(Section):
         purpose_l5 = Field('НазначениеПлатежа5', 'Назначение платежа, стр. 5')
         purpose_l6 = Field('НазначениеПлатежа6', 'Назначение платежа, стр. 6')
 
-    def __init__(self, payment_type: str = None, operation_type: str = None, code: str = None, purpose: str = None,
-                 purpose_l1: str = None, purpose_l2: str = None, purpose_l3: str = None, purpose_l4: str = None,
-                 purpose_l5: str = None, purpose_l6: str = None):
-        super(Payment, self).__init__()
-        self.payment_type = payment_type
-        self.operation_type = operation_type
-        self.code = code
-        self.purpose = purpose
-        self.purpose_l1 = purpose_l1
-        self.purpose_l2 = purpose_l2
-        self.purpose_l3 = purpose_l3
-        self.purpose_l4 = purpose_l4
-        self.purpose_l5 = purpose_l5
-        self.purpose_l6 = purpose_l6
+    __slots__ = tuple(Schema.to_dict())
 
 
 # noinspection PyShadowingBuiltins
@@ -492,21 +764,7 @@ class Tax(Section):
         date = Field('ПоказательДаты', 'Показатель даты документа', Required.BOTH)
         type = Field('ПоказательТипа', 'Показатель типа платежа')
 
-    # noinspection PyShadowingNames
-    def __init__(self, originator_status: str = None, payer_kpp: str = None, receiver_kpp: str = None, kbk: str = None,
-                 okato: str = None, basis: str = None, period: str = None, number: str = None, date: str = None,
-                 type: str = None):
-        super(Tax, self).__init__()
-        self.originator_status = originator_status
-        self.payer_kpp = payer_kpp
-        self.receiver_kpp = receiver_kpp
-        self.kbk = kbk
-        self.okato = okato
-        self.basis = basis
-        self.period = period
-        self.number = number
-        self.date = date
-        self.type = type
+    __slots__ = tuple(Schema.to_dict())
 
 
 class Special(Section):
@@ -530,22 +788,7 @@ class Special(Section):
         supplier_account_number = Field('НомерСчетаПоставщика', '№ счета поставщика')
         docs_sent_date = Field('ДатаОтсылкиДок', 'Дата отсылки документов')
 
-    def __init__(self, priority: str = None, term_of_acceptance: str = None, letter_of_credit_type: str = None,
-                 maturity: str = None, payment_condition_1: str = None, payment_condition_2: str = None,
-                 payment_condition_3: str = None, by_submission: str = None, extra_conditions: str = None,
-                 supplier_account_number: str = None, docs_sent_date: str = None):
-        super(Special, self).__init__()
-        self.priority = priority
-        self.term_of_acceptance = term_of_acceptance
-        self.letter_of_credit_type = letter_of_credit_type
-        self.maturity = maturity
-        self.payment_condition_1 = payment_condition_1
-        self.payment_condition_2 = payment_condition_2
-        self.payment_condition_3 = payment_condition_3
-        self.by_submission = by_submission
-        self.extra_conditions = extra_conditions
-        self.supplier_account_number = supplier_account_number
-        self.docs_sent_date = docs_sent_date
+    __slots__ = tuple(Schema.to_dict())
 
 
 class Document(Section):
@@ -572,51 +815,74 @@ class Document(Section):
         tax = Tax
         special = Special
 
-    # noinspection PyShadowingNames
-    def __init__(self, document_type: str = None, number: str = None, date: Type.DATE.value.type = None,
-                 amount: str = None, receipt: Receipt = None, payer: Payer = None, receiver: Receiver = None,
-                 payment: Payment = None, tax: Tax = None, special: Special = None):
-        super(Document, self).__init__()
-        self.document_type = document_type
-        self.number = number
-        self.date = date
-        self.amount = amount
-        self.receipt = receipt
-        self.payer = payer
-        self.receiver = receiver
-        self.payment = payment
-        self.tax = tax
-        self.special = special
+    __slots__ = tuple(Schema.to_dict()) + tuple(Subsections.to_dict())
 
     @classmethod
-    def from_text(cls, source_text: AnyStr):
-        extracted = cls.extract_section_text(source_text)
+    def iter_section_spans(cls, source_text: AnyStr) -> Iterator[Tuple[int, int]]:
+        # Meta.regex оставлен для совместимости: нежадный поиск по всему файлу заметно медленнее str.find
+        return iter_spans(source_text, 'СекцияДокумент', 'КонецДокумента')
+
+    @classmethod
+    def extract_section_text(cls, source_text: AnyStr):
+        result = [source_text[start:stop] for start, stop in cls.iter_section_spans(source_text)]
+        if result:
+            if len(result) == 1:
+                return result[0]
+            else:
+                return result
 
-        if not isinstance(extracted, list):
-            extracted = [extracted]
+    @classmethod
+    def iter_from_text(cls, source_text: AnyStr, fast_amounts=False) -> Iterator['Document']:
+        """
+        Генератор платежных документов из текста файла, документы разбираются по одному
 
-        results = []
-        for section_text in extracted:
-            obj: cls = super().from_text(section_text)
-            obj.receipt = Receipt.from_text(section_text)
-            obj.payer = Payer.from_text(section_text)
-            obj.receiver = Receiver.from_text(section_text)
-            obj.payment = Payment.from_text(section_text)
-            obj.tax = Tax.from_text(section_text)
-            obj.special = Special.from_text(section_text)
-            results.append(obj)
+        :param source_text: Полный текст файла выписки в формате 1CClientBankExchange
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: итератор заполненных объектов платежных документов
+        """
+        for start, stop in cls.iter_section_spans(source_text):
+            yield cls.from_line_index(build_line_index(source_text[start:stop]), fast_amounts=fast_amounts)
 
-        return results
+    @classmethod
+    def from_text(cls, source_text: AnyStr, fast_amounts=False):
+        return list(cls.iter_from_text(source_text, fast_amounts=fast_amounts))
 
-    def to_text(self, validate=True):
-        content = super(Document, self).to_text(validate=validate)
-        sections = list(filter(None, [self.receipt, self.payer, self.receiver, self.payment, self.tax, self.special]))
-        sections = list(map(lambda x: str(x), sections))
-        sections.append('КонецДокумента')
-        return content + '\n' + '\n'.join(sections)
+    @classmethod
+    def iter_from_bytes(cls, buffer: bytes, fast_amounts=False) -> Iterator['Document']:
+        """
+        Генератор платежных документов из содержимого файла в кодировке cp1251, декодируется только текущий документ
+
+        :param buffer: содержимое файла (bytes или mmap)
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: итератор заполненных объектов платежных документов
+        """
+        for start, stop in _iter_document_spans_bytes(buffer):
+            line_index = build_line_index(buffer[start:stop].decode(ENCODING))
+            yield cls.from_line_index(line_index, fast_amounts=fast_amounts)
+
+    @classmethod
+    def from_line_index(cls, line_index: dict, fast_amounts=False):
+        obj: cls = super().from_line_index(line_index, fast_amounts=fast_amounts)
+        for attr, section in cls.Subsections.to_dict().items():
+            # подсекции без единого ключа в документе (часто налоговые реквизиты и квитанция) не разбираются
+            if any(key in line_index for key in section.Schema.keys()):
+                setattr(obj, attr, section.from_line_index(line_index, fast_amounts=fast_amounts))
+            else:
+                setattr(obj, attr, section())
+        return obj
+
+    def to_lines(self, result: List[str] = None, validate=True) -> List[str]:
+        result = super(Document, self).to_lines(result, validate=validate)
+        for section in (self.receipt, self.payer, self.receiver, self.payment, self.tax, self.special):
+            if section is not None:
+                section.to_lines(result, validate=False)
+        result.append('КонецДокумента')
+        return result
 
 
 class Statement:
+    __slots__ = ('header', 'balance', 'documents')
+
     def __init__(self, header: Header, balance: Balance = None, documents: List[Document] = None):
         super(Statement, self).__init__()
         self.header: Header = header
@@ -624,35 +890,119 @@ class Statement:
         self.documents: List[Document] = documents
 
     @classmethod
-    def from_file(cls, filename: str):
+    def from_file(cls, filename: str, fast_amounts=False):
         """
         Конструктор полного документа выписки из файла
 
         :param filename: Путь к файлу
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
         :return: Заполненный объект полного документа выписки
         """
-        text = open(filename, encoding='cp1251').read()
-        return cls.from_text(text)
+        with open(filename, 'rb') as file:
+            return cls.from_bytes(file.read(), fast_amounts=fast_amounts)
 
     @classmethod
-    def from_text(cls, source_text):
+    def from_file_mmap(cls, filename: str, fast_amounts=False):
+        """
+        Конструктор полного документа выписки из файла, отображенного в память: файл не читается в память
+        целиком, декодируются только найденные секции
+
+        :param filename: Путь к файлу
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: Заполненный объект полного документа выписки
+        """
+        with open(filename, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                # пустой файл отобразить в память нельзя
+                return cls.from_bytes(b'', fast_amounts=fast_amounts)
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return cls.from_bytes(buffer, fast_amounts=fast_amounts)
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes, fast_amounts=False):
+        """
+        Конструктор полного документа выписки из содержимого файла в кодировке cp1251. Границы секций ищутся
+        в байтах, декодируются только сами секции
+
+        :param buffer: содержимое файла (bytes или mmap)
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: Заполненный объект полного документа выписки
+        """
+        header_span, balance_span = _section_spans_bytes(buffer)
+
+        def parse(section_cls, start, stop):
+            line_index = build_line_index(buffer[start:stop].decode(ENCODING))
+            return section_cls.from_line_index(line_index, fast_amounts=fast_amounts)
+
+        return cls(
+            header=parse(Header, *header_span),
+            balance=parse(Balance, *balance_span) if balance_span else None,
+            documents=list(Document.iter_from_bytes(buffer, fast_amounts=fast_amounts))
+        )
+
+    @classmethod
+    def from_text(cls, source_text, fast_amounts=False):
         """
         Конструктор полного документа выписки из текста файла
 
         :param source_text: Полный текст файла выписки в формате 1CClientBankExchange
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
         :return: Заполненный объект полного документа выписки
         """
 
         # return source_text
         return cls(
             header=Header.from_text(source_text),
-            balance=Balance.from_text(source_text),
-            documents=Document.from_text(source_text)
+            balance=Balance.from_text(source_text, fast_amounts=fast_amounts),
+            documents=list(Document.iter_from_text(source_text, fast_amounts=fast_amounts))
+        )
+
+    @classmethod
+    def iter_documents_from_file(cls, filename: str, fast_amounts=False) -> Iterator[Document]:
+        """
+        Генератор платежных документов файла без построения полного списка: файл отображается в память,
+        в памяти одновременно только текущий декодированный документ
+
+        :param filename: Путь к файлу
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: итератор заполненных объектов платежных документов
+        """
+        with open(filename, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                # пустой файл отобразить в память нельзя
+                return
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from Document.iter_from_bytes(buffer, fast_amounts=fast_amounts)
+
+    @classmethod
+    def iter_documents_from_text(cls, source_text: str, fast_amounts=False) -> Iterator[Document]:
+        """
+        Генератор платежных документов из текста файла без построения полного списка
+
+        :param source_text: Полный текст файла выписки в формате 1CClientBankExchange
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: итератор заполненных объектов платежных документов
+        """
+        return Document.iter_from_text(source_text, fast_amounts=fast_amounts)
+
+    @classmethod
+    def total_amount_streaming(cls, filename: str, fast_amounts=False):
+        """
+        Сумма платежных документов файла без построения списка документов
+
+        :param filename: Путь к файлу
+        :param fast_amounts: считать в Kopecks вместо Decimal
+        :return: сумма документов
+        """
+        return sum_amounts(
+            document.amount for document in cls.iter_documents_from_file(filename, fast_amounts=fast_amounts)
         )
 
     @classmethod
     def from_documents(cls, sender: str, documents: List[Document]):
-        payments_from_the_only_bank = len(set([d.payer.bank_bic for d in documents])) == 1
+        payments_from_the_only_bank = len({d.payer.bank_bic for d in documents}) == 1
         if not payments_from_the_only_bank:
             raise ValueError('Файл для загрузки в банк должен содержать платежи только из одного банка!')
 
@@ -667,24 +1017,39 @@ class Statement:
                 creation_time=datetime.now(),
                 filter_date_since=min(dates),
                 filter_date_till=max(dates),
-                filter_account_numbers=set([d.payer.account_number for d in documents])
+                filter_account_numbers={d.payer.account_number for d in documents}
             ),
             balance=None,
             documents=documents
         )
 
     def to_text(self, validate=True):
-        results = [
-            self.header.to_text(validate=validate),
-            self.balance.to_text(validate=validate) if self.balance else None
-        ]
+        return '\n'.join(self.to_lines(validate=validate))
 
-        if self.documents:
-            results.extend([doc.to_text(validate=validate) for doc in self.documents])
+    def to_lines(self, result: List[str] = None, validate=True) -> List[str]:
+        """
+        Дописывает строки всей выписки в переданный список; секции разделяются пустой строкой
 
-        results.append('КонецФайла')
+        :param result: список строк, который нужно дополнить; если не передан, создается новый
+        :param validate: проверять заполненность обязательных при отправке в банк аттрибутов
+        :return: дополненный список строк
+        """
+        if result is None:
+            result = []
+
+        self.header.to_lines(result, validate=validate)
+        result.append('')
+
+        if self.balance:
+            self.balance.to_lines(result, validate=validate)
+            result.append('')
+
+        for document in self.documents or ():
+            document.to_lines(result, validate=validate)
+            result.append('')
 
-        return '\n\n'.join(filter(lambda x: x, results))
+        result.append('КонецФайла')
+        return result
 
     def __str__(self):
         return self.to_text(validate=False)
@@ -693,4 +1058,101 @@ class Statement:
         return len(self.documents)
 
     def total_amount(self):
-        return reduce(lambda x, y: x + y, [doc.amount for doc in self.documents]) if self.documents else 0
+        return sum_amounts(doc.amount for doc in self.documents or ())
+
+
+def _document_layout() -> Tuple[Tuple[str, Optional[str], str, Field], ...]:
+    """
+    Раскладка платежного документа по колонкам: сначала поля документа, затем поля подсекций с префиксом подсекции
+
+    :return: кортеж (колонка, аттрибут подсекции или None, аттрибут поля, поле)
+    """
+    layout = [(attr, None, attr, field) for attr, field in Document.Schema.to_dict().items()]
+    for section_attr, section in Document.Subsections.to_dict().items():
+        layout.extend(
+            (f'{section_attr}_{attr}', section_attr, attr, field) for attr, field in section.Schema.to_dict().items()
+        )
+    return tuple(layout)
+
+
+class DocumentTable:
+    """
+    Платежные документы, хранящиеся по колонкам: по списку значений на каждое поле документа и его подсекций,
+    например number, amount, payer_account. Подходит для выборок и агрегатов по большому числу документов, где
+    нужны лишь несколько полей; объекты Document создаются только по запросу
+    """
+
+    layout = _document_layout()
+    __slots__ = tuple(column for column, _, _, _ in layout)
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    @classmethod
+    def from_text(cls, source_text: AnyStr, fast_amounts=False):
+        """
+        Конструктор таблицы документов из текста файла
+
+        :param source_text: Полный текст файла выписки в формате 1CClientBankExchange
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: Заполненная таблица документов
+        """
+        table = cls()
+        for start, stop in Document.iter_section_spans(source_text):
+            table.append_line_index(build_line_index(source_text[start:stop]), fast_amounts=fast_amounts)
+        return table
+
+    @classmethod
+    def from_file(cls, filename: str, fast_amounts=False):
+        """
+        Конструктор таблицы документов из файла, декодируются только секции документов
+
+        :param filename: Путь к файлу
+        :param fast_amounts: хранить суммы как Kopecks вместо Decimal
+        :return: Заполненная таблица документов
+        """
+        with open(filename, 'rb') as file:
+            buffer = file.read()
+
+        table = cls()
+        for start, stop in _iter_document_spans_bytes(buffer):
+            table.append_line_index(build_line_index(buffer[start:stop].decode(ENCODING)), fast_amounts=fast_amounts)
+        return table
+
+    def append_line_index(self, line_index: dict, fast_amounts=False):
+        """
+        Добавляет строку таблицы из разобранных строк секции документа, см. build_line_index
+        """
+        for column, _, _, field in self.layout:
+            getattr(self, column).append(field.get_value_from_lines(line_index.get(field.key, []), fast_amounts))
+
+    def append(self, document: Document):
+        """
+        Добавляет строку таблицы из объекта платежного документа
+        """
+        for column, section_attr, attr, _ in self.layout:
+            source = getattr(document, section_attr) if section_attr else document
+            getattr(self, column).append(getattr(source, attr, None) if source is not None else None)
+
+    def row(self, index: int) -> Document:
+        """
+        Собирает объект платежного документа из строки таблицы
+
+        :param index: номер строки
+        :return: Заполненный объект платежного документа
+        """
+        document = Document(**{attr: section() for attr, section in Document.Subsections.to_dict().items()})
+        for column, section_attr, attr, _ in self.layout:
+            target = getattr(document, section_attr) if section_attr else document
+            setattr(target, attr, getattr(self, column)[index])
+        return document
+
+    def __len__(self):
+        return len(self.number)
+
+    def __iter__(self) -> Iterator[Document]:
+        return (self.row(index) for index in range(len(self)))
+
+    def total_amount(self):
+        return sum_amounts(self.amount)
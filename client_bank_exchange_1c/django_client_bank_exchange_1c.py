@@ -1,10 +1,219 @@
-from typing import List, Optional
+import csv
+import io
+import os
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-from django.db import models
-from client_bank_exchange_1c import (
-    Statement, Header, Balance, Document, Payer, Payment, Receipt, Receiver, Special,
-    Tax,
-)
+from django import forms
+from django.core import exceptions, validators
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy
+from client_bank_exchange_1c import Statement, Header, Balance, Document, DocumentTable, Kopecks
+
+# размер пакета bulk_create: PostgreSQL перестает ускоряться примерно на 1000 строк, MySQL/MariaDB выигрывают от больших
+BATCH_SIZE = int(os.environ.get('DJANGO_CLIENT_BANK_EXCHANGE_BATCH_SIZE', '1000'))
+
+
+class NullableMixin:
+    """
+    Поле, необязательное в базе и в формах: null=True, blank=True по умолчанию, как у всех полей формата
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if type(self).__module__ == __name__:
+            # в миграциях поле записывается базовым полем с явными null/blank: миграции проектов не меняются
+            # и не зависят от имен Null*Field
+            mro = type(self).__mro__
+            base = mro[mro.index(NullableMixin) + 1]
+            if base.__module__.startswith('django.db.models'):
+                path = f'django.db.models.{base.__name__}'
+            else:
+                path = f'{base.__module__}.{base.__qualname__}'
+        return name, path, args, kwargs
+
+
+class NullTextField(NullableMixin, models.TextField):
+    pass
+
+
+class NullCharField(NullableMixin, models.CharField):
+    pass
+
+
+class NullDateField(NullableMixin, models.DateField):
+    pass
+
+
+class NullTimeField(NullableMixin, models.TimeField):
+    pass
+
+
+class NullIntegerField(NullableMixin, models.IntegerField):
+    pass
+
+
+class MoneyCentsField(models.BigIntegerField):
+    """
+    Денежная сумма, хранимая в базе целым числом копеек. В модели значение Decimal с двумя знаками после точки,
+    суммы Kopecks (см. fast_amounts) записываются без преобразования.
+
+    Абстрактные модели хранят суммы в DecimalField. Поле подключается явно переопределением поля в конкретной
+    модели, например amount = NullMoneyCentsField(); существующие строки при этом нужно умножить на 100 отдельной
+    миграцией данных: AlterField сам значения не пересчитывает
+    """
+
+    default_error_messages = {
+        'invalid': gettext_lazy('“%(value)s” value must be a decimal number.'),
+    }
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Decimal(value).scaleb(-2)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        if isinstance(value, Kopecks):
+            return value.to_decimal()
+        try:
+            return Decimal(str(value) if isinstance(value, float) else value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_prep_value(self, value):
+        if isinstance(value, Kopecks):
+            return int(value)
+        value = self.to_python(value)
+        return None if value is None else int(value.scaleb(2).to_integral_value())
+
+    def get_ruble_range(self) -> Tuple[Optional[Decimal], Optional[Decimal]]:
+        """
+        :return: (минимум, максимум) суммы в рублях, которая помещается в колонку bigint копеек
+        """
+        min_value, max_value = connection.ops.integer_field_range(self.get_internal_type())
+        return (
+            None if min_value is None else Decimal(min_value).scaleb(-2),
+            None if max_value is None else Decimal(max_value).scaleb(-2),
+        )
+
+    @cached_property
+    def validators(self):
+        # границы bigint заданы в копейках, а значение поля в рублях: IntegerField проверял бы их без пересчета
+        min_value, max_value = self.get_ruble_range()
+        result = [*self.default_validators, *self._validators]
+        if min_value is not None:
+            result.append(validators.MinValueValidator(min_value))
+        if max_value is not None:
+            result.append(validators.MaxValueValidator(max_value))
+        return result
+
+    def formfield(self, **kwargs):
+        min_value, max_value = self.get_ruble_range()
+        return super().formfield(**{
+            'form_class': forms.DecimalField,
+            'decimal_places': 2,
+            'min_value': min_value,
+            'max_value': max_value,
+            **kwargs,
+        })
+
+
+class NullMoneyCentsField(NullableMixin, MoneyCentsField):
+    pass
+
+
+def money_to_decimal(value):
+    """
+    Сумма Kopecks (см. fast_amounts) в рублях для DecimalField: Decimal(Kopecks) дал бы сумму в 100 раз больше
+
+    :param value: сумма Kopecks, Decimal или None
+    :return: сумма в рублях или исходное значение
+    """
+    return value.to_decimal() if isinstance(value, Kopecks) else value
+
+
+def _document_field_getters() -> Tuple[Tuple[Optional[str], Tuple[str, ...], attrgetter], ...]:
+    """
+    Получение значений полей модели из платежного документа по секциям: подсекция читается из документа один раз,
+    все ее поля затем одним вызовом attrgetter. Имена полей модели совпадают с колонками DocumentTable
+
+    :return: кортеж (аттрибут подсекции или None для полей документа, поля модели, attrgetter полей секции)
+    """
+    groups = {}
+    for column, section_attr, attr, _ in DocumentTable.layout:
+        groups.setdefault(section_attr, []).append((column, attr))
+    return tuple(
+        (section_attr, tuple(column for column, _ in fields), attrgetter(*(attr for _, attr in fields)))
+        for section_attr, fields in groups.items()
+    )
+
+
+_DOC_FIELD_GETTERS = _document_field_getters()
+
+
+def _to_document_sections() -> Tuple[Tuple[type, slice], ...]:
+    """
+    Конструкторы подсекций и границы их полей в кортеже _TO_DOC_GET: колонки DocumentTable идут подряд по подсекциям
+
+    :return: кортеж (класс подсекции, срез ее полей) в порядке подсекций документа
+    """
+    sections = []
+    start = len(Document.Schema.to_dict())
+    for section in Document.Subsections.to_dict().values():
+        stop = start + len(section.Schema.to_dict())
+        sections.append((section, slice(start, stop)))
+        start = stop
+    return tuple(sections)
+
+
+# все поля модели для to_document одним вызовом, затем значения раскладываются позиционно по конструкторам секций
+_TO_DOC_FIELDS = tuple(column for column, *_ in DocumentTable.layout)
+_TO_DOC_GET = attrgetter(*_TO_DOC_FIELDS)
+_TO_DOC_ITEMS = itemgetter(*_TO_DOC_FIELDS)
+_TO_DOC_FIELDS_SLICE = slice(len(Document.Schema.to_dict()))
+_TO_DOC_SECTIONS = _to_document_sections()
+
+# поля назначения платежа, которые можно изменить через DjangoDocument.update_purpose_lines
+PURPOSE_FIELDS = frozenset(('payment_purpose',) + tuple(f'payment_purpose_l{i}' for i in range(1, 7)))
+
+
+def document_from_values(values: tuple) -> Document:
+    """
+    Платежный документ из значений полей модели в порядке колонок DocumentTable
+
+    :param values: значения полей модели
+    :return: платежный документ
+    """
+    # конструкторы секций и срезы заранее связаны в _TO_DOC_SECTIONS, без поиска имен модуля на каждую секцию
+    return Document(*values[_TO_DOC_FIELDS_SLICE], *[section(*values[part]) for section, part in _TO_DOC_SECTIONS])
+
+
+def build_document_kwargs(document: Document) -> dict:
+    """
+    Значения полей DjangoDocument из платежного документа
+
+    :param document: платежный документ
+    :return: словарь {поле модели: значение}
+    """
+    kwargs = {}
+    for section_attr, names, getter in _DOC_FIELD_GETTERS:
+        kwargs.update(zip(names, getter(getattr(document, section_attr) if section_attr else document)))
+    return kwargs
+
+
+try:
+    # собранное расширение с той же функцией, см. _fast_convert.pyx
+    from client_bank_exchange_1c._fast_convert import build_document_kwargs
+except ImportError:
+    pass
 
 
 class DjangoStatement(models.Model):
@@ -15,17 +224,17 @@ class DjangoStatement(models.Model):
     class Meta:
         abstract = True
 
-    format_version = models.TextField(null=True, blank=True)
-    encoding = models.TextField(null=True, blank=True)
-    sender = models.TextField(null=True, blank=True)
-    receiver = models.TextField(null=True, blank=True)
-    creation_date = models.DateField(null=True, blank=True)
-    creation_time = models.TimeField(null=True, blank=True)
-    filter_date_since = models.DateField(null=True, blank=True)
-    filter_date_till = models.DateField(null=True, blank=True)
-    balance_date_since = models.DateField(null=True, blank=True)
-    balance_date_till = models.DateField(null=True, blank=True)
-    balance_account_number = models.CharField(max_length=20, null=True, blank=True)
+    format_version = NullTextField()
+    encoding = NullTextField()
+    sender = NullTextField()
+    receiver = NullTextField()
+    creation_date = NullDateField()
+    creation_time = NullTimeField()
+    filter_date_since = NullDateField()
+    filter_date_till = NullDateField()
+    balance_date_since = NullDateField()
+    balance_date_till = NullDateField()
+    balance_account_number = NullCharField(max_length=20)
     balance_initial_balance = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     balance_total_income = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     balance_total_expense = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
@@ -33,24 +242,48 @@ class DjangoStatement(models.Model):
 
     @classmethod
     def from_statement(cls, statement: Statement):
+        h = statement.header
+        # выписка без секции остатков сохраняется с пустыми полями остатков
+        b = statement.balance or Balance()
         return cls(
-            format_version=statement.header.format_version,
-            encoding=statement.header.encoding,
-            sender=statement.header.sender,
-            receiver=statement.header.receiver,
-            creation_date=statement.header.creation_date,
-            creation_time=statement.header.creation_time,
-            filter_date_since=statement.header.filter_date_since,
-            filter_date_till=statement.header.filter_date_till,
-            balance_date_since=statement.balance.date_since,
-            balance_date_till=statement.balance.date_till,
-            balance_account_number=statement.balance.account_number,
-            balance_initial_balance=statement.balance.initial_balance,
-            balance_total_income=statement.balance.total_income,
-            balance_total_expense=statement.balance.total_expense,
-            balance_final_balance=statement.balance.final_balance
+            format_version=h.format_version,
+            encoding=h.encoding,
+            sender=h.sender,
+            receiver=h.receiver,
+            creation_date=h.creation_date,
+            creation_time=h.creation_time,
+            filter_date_since=h.filter_date_since,
+            filter_date_till=h.filter_date_till,
+            balance_date_since=b.date_since,
+            balance_date_till=b.date_till,
+            balance_account_number=b.account_number,
+            balance_initial_balance=money_to_decimal(b.initial_balance),
+            balance_total_income=money_to_decimal(b.total_income),
+            balance_total_expense=money_to_decimal(b.total_expense),
+            balance_final_balance=money_to_decimal(b.final_balance)
         )
 
+    @classmethod
+    def save_statement(cls, statement: Statement, document_cls: type, statement_field: Optional[str] = None,
+                       **document_fields):
+        """
+        Сохраняет выписку и ее платежные документы в одной транзакции, документы пакетами через bulk_create
+
+        :param statement: полный документ выписки
+        :param document_cls: модель документов, унаследованная от DjangoDocument
+        :param statement_field: имя поля модели документов, ссылающегося на выписку (например внешний ключ
+            statement): в него записывается только что сохраненный объект выписки
+        :param document_fields: значения остальных полей модели документов, не заполняемых из выписки
+        :return: (сохраненный объект выписки, список сохраненных объектов документов)
+        """
+        with transaction.atomic():
+            head = cls.from_statement(statement)
+            head.save()
+            if statement_field:
+                document_fields[statement_field] = head
+            documents = document_cls.bulk_from_documents(statement.documents or [], **document_fields)
+        return head, documents
+
     # noinspection PyTypeChecker
     def to_statement(self, documents: Optional[List[Document]]=None):
         return Statement(
@@ -76,6 +309,16 @@ class DjangoStatement(models.Model):
             documents=documents or []
         )
 
+    def to_statement_streaming(self, queryset):
+        """
+        Выписка с платежными документами из выборки модели документов. Строки читаются курсором частями, объекты
+        модели документов не создаются, см. DjangoDocument.iter_documents
+
+        :param queryset: выборка объектов модели, унаследованной от DjangoDocument
+        :return: полный документ выписки
+        """
+        return self.to_statement(documents=list(queryset.model.iter_documents(queryset)))
+
 
 class DjangoDocument(models.Model):
     """
@@ -84,230 +327,301 @@ class DjangoDocument(models.Model):
 
     class Meta:
         abstract = True
+        # индексы только под типовые выборки, остальные поля без индексов ради скорости вставки;
+        # наследники сохраняют их, если их Meta наследует DjangoDocument.Meta
+        indexes = [
+            models.Index(fields=['date', 'number']),
+            models.Index(fields=['payer_inn']),
+            models.Index(fields=['receiver_inn']),
+        ]
 
-    document_type = models.TextField(null=True, blank=True)
-    number = models.IntegerField(null=True, blank=True)
-    date = models.DateField(null=True, blank=True)
+    document_type = NullTextField()
+    number = NullIntegerField()
+    date = NullDateField()
     amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
 
-    receipt_date = models.DateField(null=True, blank=True)
-    receipt_time = models.TimeField(null=True, blank=True)
-    receipt_content = models.TextField(null=True, blank=True)
-
-    payer_account = models.CharField(max_length=20, null=True, blank=True)
-    payer_date_charged = models.DateField(null=True, blank=True)
-    payer_name = models.TextField(null=True, blank=True)
-    payer_inn = models.CharField(max_length=12, null=True, blank=True)
-    payer_l1_name = models.TextField(null=True, blank=True)
-    payer_l2_account_number = models.TextField(null=True, blank=True)
-    payer_l3_bank = models.TextField(null=True, blank=True)
-    payer_l4_city = models.TextField(null=True, blank=True)
-    payer_account_number = models.CharField(max_length=20, null=True, blank=True)
-    payer_bank_1_name = models.TextField(null=True, blank=True)
-    payer_bank_2_city = models.TextField(null=True, blank=True)
-    payer_bank_bic = models.CharField(max_length=9, null=True, blank=True)
-    payer_bank_corr_account = models.CharField(max_length=20, null=True, blank=True)
-
-    receiver_account = models.CharField(max_length=20, null=True, blank=True)
-    receiver_date_received = models.DateField(null=True, blank=True)
-    receiver_name = models.TextField(null=True, blank=True)
-    receiver_inn = models.CharField(max_length=12, null=True, blank=True)
-    receiver_l1_name = models.TextField(null=True, blank=True)
-    receiver_l2_account_number = models.TextField(null=True, blank=True)
-    receiver_l3_bank = models.TextField(null=True, blank=True)
-    receiver_l4_city = models.TextField(null=True, blank=True)
-    receiver_account_number = models.CharField(max_length=20, null=True, blank=True)
-    receiver_bank_1_name = models.TextField(null=True, blank=True)
-    receiver_bank_2_city = models.TextField(null=True, blank=True)
-    receiver_bank_bic = models.CharField(max_length=9, null=True, blank=True)
-    receiver_bank_corr_account = models.CharField(max_length=20, null=True, blank=True)
-
-    payment_payment_type = models.TextField(null=True, blank=True)
-    payment_operation_type = models.CharField(max_length=2, null=True, blank=True)
-    payment_code = models.CharField(max_length=25, null=True, blank=True)
-    payment_purpose = models.TextField(null=True, blank=True)
-    payment_purpose_l1 = models.TextField(null=True, blank=True)
-    payment_purpose_l2 = models.TextField(null=True, blank=True)
-    payment_purpose_l3 = models.TextField(null=True, blank=True)
-    payment_purpose_l4 = models.TextField(null=True, blank=True)
-    payment_purpose_l5 = models.TextField(null=True, blank=True)
-    payment_purpose_l6 = models.TextField(null=True, blank=True)
-
-    tax_originator_status = models.CharField(max_length=2, null=True, blank=True)
-    tax_payer_kpp = models.CharField(max_length=9, null=True, blank=True)
-    tax_receiver_kpp = models.CharField(max_length=9, null=True, blank=True)
-    tax_kbk = models.CharField(max_length=20, null=True, blank=True)
-    tax_okato = models.CharField(max_length=11, null=True, blank=True)
-    tax_basis = models.CharField(max_length=2, null=True, blank=True)
-    tax_period = models.CharField(max_length=10, null=True, blank=True)
-    tax_number = models.TextField(null=True, blank=True)
-    tax_date = models.TextField(null=True, blank=True)
-    tax_type = models.TextField(null=True, blank=True)
-
-    special_priority = models.CharField(max_length=2, null=True, blank=True)
-    special_term_of_acceptance = models.TextField(null=True, blank=True)
-    special_letter_of_credit_type = models.TextField(null=True, blank=True)
-    special_maturity = models.TextField(null=True, blank=True)
-    special_payment_condition_1 = models.TextField(null=True, blank=True)
-    special_payment_condition_2 = models.TextField(null=True, blank=True)
-    special_payment_condition_3 = models.TextField(null=True, blank=True)
-    special_by_submission = models.TextField(null=True, blank=True)
-    special_extra_conditions = models.TextField(null=True, blank=True)
-    special_supplier_account_number = models.TextField(null=True, blank=True)
-    special_docs_sent_date = models.TextField(null=True, blank=True)
+    receipt_date = NullDateField()
+    receipt_time = NullTimeField()
+    receipt_content = NullTextField()
+
+    payer_account = NullCharField(max_length=20)
+    payer_date_charged = NullDateField()
+    payer_name = NullTextField()
+    payer_inn = NullCharField(max_length=12)
+    payer_l1_name = NullCharField(max_length=160)
+    payer_l2_account_number = NullCharField(max_length=160)
+    payer_l3_bank = NullCharField(max_length=160)
+    payer_l4_city = NullCharField(max_length=160)
+    payer_account_number = NullCharField(max_length=20)
+    payer_bank_1_name = NullCharField(max_length=160)
+    payer_bank_2_city = NullCharField(max_length=160)
+    payer_bank_bic = NullCharField(max_length=9)
+    payer_bank_corr_account = NullCharField(max_length=20)
+
+    receiver_account = NullCharField(max_length=20)
+    receiver_date_received = NullDateField()
+    receiver_name = NullTextField()
+    receiver_inn = NullCharField(max_length=12)
+    receiver_l1_name = NullCharField(max_length=160)
+    receiver_l2_account_number = NullCharField(max_length=160)
+    receiver_l3_bank = NullCharField(max_length=160)
+    receiver_l4_city = NullCharField(max_length=160)
+    receiver_account_number = NullCharField(max_length=20)
+    receiver_bank_1_name = NullCharField(max_length=160)
+    receiver_bank_2_city = NullCharField(max_length=160)
+    receiver_bank_bic = NullCharField(max_length=9)
+    receiver_bank_corr_account = NullCharField(max_length=20)
+
+    payment_payment_type = NullTextField()
+    payment_operation_type = NullCharField(max_length=2)
+    payment_code = NullCharField(max_length=25)
+    payment_purpose = NullTextField()
+    payment_purpose_l1 = NullCharField(max_length=160)
+    payment_purpose_l2 = NullCharField(max_length=160)
+    payment_purpose_l3 = NullCharField(max_length=160)
+    payment_purpose_l4 = NullCharField(max_length=160)
+    payment_purpose_l5 = NullCharField(max_length=160)
+    payment_purpose_l6 = NullCharField(max_length=160)
+
+    tax_originator_status = NullCharField(max_length=2)
+    tax_payer_kpp = NullCharField(max_length=9)
+    tax_receiver_kpp = NullCharField(max_length=9)
+    tax_kbk = NullCharField(max_length=20)
+    tax_okato = NullCharField(max_length=11)
+    tax_basis = NullCharField(max_length=2)
+    tax_period = NullCharField(max_length=10)
+    tax_number = NullTextField()
+    tax_date = NullTextField()
+    tax_type = NullTextField()
+
+    special_priority = NullCharField(max_length=2)
+    special_term_of_acceptance = NullTextField()
+    special_letter_of_credit_type = NullTextField()
+    special_maturity = NullTextField()
+    special_payment_condition_1 = NullTextField()
+    special_payment_condition_2 = NullTextField()
+    special_payment_condition_3 = NullTextField()
+    special_by_submission = NullTextField()
+    special_extra_conditions = NullTextField()
+    special_supplier_account_number = NullTextField()
+    special_docs_sent_date = NullTextField()
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def field_spec(cls) -> Tuple[Tuple[str, str], ...]:
+        """
+        Поля таблицы модели в порядке Model.__init__, вычисляются один раз на класс
+
+        :return: кортеж пар (аттрибут, колонка таблицы)
+        """
+        return tuple((field.attname, field.column) for field in cls._meta.concrete_fields)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def document_plan(cls) -> Tuple[Tuple[str, ...], itemgetter, tuple, Tuple[tuple, ...], Tuple[int, ...]]:
+        """
+        План сборки объекта модели из платежного документа, вычисляется один раз на класс: значения документа в
+        порядке _TO_DOC_FIELDS дополняются постоянными значениями по умолчанию остальных полей и одним itemgetter
+        раскладываются в порядке полей таблицы
+
+        :return: (аттрибуты полей таблицы, itemgetter значений в порядке полей, постоянные значения по умолчанию,
+            пары (индекс, вычисляемое значение по умолчанию), индексы полей документа типа DecimalField)
+        """
+        doc_indexes = {name: index for index, name in enumerate(_TO_DOC_FIELDS)}
+        positions, constants, default_slots, money_indexes = [], [], [], []
+        for index, field in enumerate(cls._meta.concrete_fields):
+            if field.attname in doc_indexes:
+                positions.append(doc_indexes[field.attname])
+                if isinstance(field, models.DecimalField):
+                    money_indexes.append(index)
+                continue
+            # значение по умолчанию без вызываемого default одинаково для всех объектов и берется из кортежа
+            positions.append(len(_TO_DOC_FIELDS) + len(constants))
+            if field.has_default() and callable(field.default):
+                constants.append(None)
+                default_slots.append((index, field.get_default))
+            else:
+                constants.append(field.get_default())
+        return (
+            tuple(attname for attname, _ in cls.field_spec()), itemgetter(*positions), tuple(constants),
+            tuple(default_slots), tuple(money_indexes)
+        )
+
+    @classmethod
+    def _from_document_plan(cls, document: Document, field_names: Tuple[str, ...], reorder: itemgetter,
+                            constants: tuple, default_slots: Tuple[tuple, ...], money_indexes: Tuple[int, ...]):
+        """
+        Объект модели из платежного документа по плану document_plan(). Собирается через Model.from_db
+        позиционными значениями в порядке полей таблицы, без разбора ~60 именованных аргументов в Model.__init__
+
+        :param document: платежный документ
+        :return: несохраненный объект модели
+        """
+        values = list(reorder(_TO_DOC_ITEMS(build_document_kwargs(document)) + constants))
+        for index, get_default in default_slots:
+            values[index] = get_default()
+        for index in money_indexes:
+            values[index] = money_to_decimal(values[index])
+        obj = cls.from_db(None, field_names, values)
+        # from_db помечает объект загруженным из базы, а он еще не сохранен
+        obj._state.adding = True
+        return obj
+
+    @classmethod
+    def iter_from_documents(cls, documents: Iterable[Document]):
+        """
+        Объекты модели из платежных документов
+
+        :param documents: платежные документы
+        :return: итератор несохраненных объектов модели
+        """
+        plan = cls.document_plan()
+        for document in documents:
+            yield cls._from_document_plan(document, *plan)
 
     @classmethod
     def from_document(cls, document: Document):
-        return cls(
-            document_type=document.document_type,
-            number=document.number,
-            date=document.date,
-            amount=document.amount,
-
-            receipt_date=document.receipt.date,
-            receipt_time=document.receipt.time,
-            receipt_content=document.receipt.content,
-
-            payer_account=document.payer.account,
-            payer_date_charged=document.payer.date_charged,
-            payer_name=document.payer.name,
-            payer_inn=document.payer.inn,
-            payer_l1_name=document.payer.l1_name,
-            payer_l2_account_number=document.payer.l2_account_number,
-            payer_l3_bank=document.payer.l3_bank,
-            payer_l4_city=document.payer.l4_city,
-            payer_account_number=document.payer.account_number,
-            payer_bank_1_name=document.payer.bank_1_name,
-            payer_bank_2_city=document.payer.bank_2_city,
-            payer_bank_bic=document.payer.bank_bic,
-            payer_bank_corr_account=document.payer.bank_corr_account,
-
-            receiver_account=document.receiver.account,
-            receiver_date_received=document.receiver.date_received,
-            receiver_name=document.receiver.name,
-            receiver_inn=document.receiver.inn,
-            receiver_l1_name=document.receiver.l1_name,
-            receiver_l2_account_number=document.receiver.l2_account_number,
-            receiver_l3_bank=document.receiver.l3_bank,
-            receiver_l4_city=document.receiver.l4_city,
-            receiver_account_number=document.receiver.account_number,
-            receiver_bank_1_name=document.receiver.bank_1_name,
-            receiver_bank_2_city=document.receiver.bank_2_city,
-            receiver_bank_bic=document.receiver.bank_bic,
-            receiver_bank_corr_account=document.receiver.bank_corr_account,
-
-            payment_payment_type=document.payment.payment_type,
-            payment_operation_type=document.payment.operation_type,
-            payment_code=document.payment.code,
-            payment_purpose=document.payment.purpose,
-            payment_purpose_l1=document.payment.purpose_l1,
-            payment_purpose_l2=document.payment.purpose_l2,
-            payment_purpose_l3=document.payment.purpose_l3,
-            payment_purpose_l4=document.payment.purpose_l4,
-            payment_purpose_l5=document.payment.purpose_l5,
-            payment_purpose_l6=document.payment.purpose_l6,
-
-            tax_originator_status=document.tax.originator_status,
-            tax_payer_kpp=document.tax.payer_kpp,
-            tax_receiver_kpp=document.tax.receiver_kpp,
-            tax_kbk=document.tax.kbk,
-            tax_okato=document.tax.okato,
-            tax_basis=document.tax.basis,
-            tax_period=document.tax.period,
-            tax_number=document.tax.number,
-            tax_date=document.tax.date,
-            tax_type=document.tax.type,
-
-            special_priority=document.special.priority,
-            special_term_of_acceptance=document.special.term_of_acceptance,
-            special_letter_of_credit_type=document.special.letter_of_credit_type,
-            special_maturity=document.special.maturity,
-            special_payment_condition_1=document.special.payment_condition_1,
-            special_payment_condition_2=document.special.payment_condition_2,
-            special_payment_condition_3=document.special.payment_condition_3,
-            special_by_submission=document.special.by_submission,
-            special_extra_conditions=document.special.extra_conditions,
-            special_supplier_account_number=document.special.supplier_account_number,
-            special_docs_sent_date=document.special.docs_sent_date
+        return cls._from_document_plan(document, *cls.document_plan())
+
+    @classmethod
+    def bulk_from_documents(cls, documents: Iterable[Document], batch_size: int = BATCH_SIZE,
+                            ignore_conflicts: bool = False, **fields):
+        """
+        Сохраняет платежные документы пакетами через bulk_create вместо отдельного save() на каждый документ
+
+        :param documents: платежные документы
+        :param batch_size: количество строк в одном INSERT, по умолчанию DJANGO_CLIENT_BANK_EXCHANGE_BATCH_SIZE
+        :param ignore_conflicts: пропускать строки, нарушающие ограничения уникальности, без предварительной проверки
+        :param fields: значения полей наследника, одинаковые для всех объектов, например statement=выписка
+        :return: список сохраненных объектов модели
+        """
+        objs = list(cls.iter_from_documents(documents))
+        if fields:
+            for obj in objs:
+                for name, value in fields.items():
+                    setattr(obj, name, value)
+        return cls.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+    @classmethod
+    def copy_from_documents(cls, documents: Iterable[Document], chunk_size: int = 10000,
+                            using: str = DEFAULT_DB_ALIAS, **fields) -> int:
+        """
+        Загружает платежные документы через COPY FROM STDIN в формате CSV, для миллионов строк быстрее bulk_create.
+        Только PostgreSQL с драйвером psycopg2 (cursor.copy_expert). Заполняются поля документа и переданные fields:
+        id и остальные поля наследников получают значения по умолчанию базы данных, объекты модели и сигналы не
+        создаются
+
+        :param documents: платежные документы
+        :param chunk_size: количество строк в одном COPY
+        :param using: псевдоним базы данных
+        :param fields: значения полей наследника, одинаковые для всех строк, например statement=выписка
+        :return: количество загруженных документов
+        """
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        columns = [field.column for field in map(cls._meta.get_field, _TO_DOC_FIELDS)]
+        # значения fields присваиваются объекту, как в bulk_from_documents: внешний ключ принимает объект модели
+        probe = cls()
+        overrides, extra_values = [], []
+        for name, value in fields.items():
+            field = cls._meta.get_field(name)
+            setattr(probe, name, value)
+            value = field.get_db_prep_save(getattr(probe, field.attname), connection)
+            if name in _TO_DOC_FIELDS:
+                overrides.append((_TO_DOC_FIELDS.index(name), value))
+            else:
+                columns.append(field.column)
+                extra_values.append(value)
+        sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(
+            quote_name(cls._meta.db_table), ', '.join(map(quote_name, columns))
         )
+        money_fields = [
+            (index, field) for index, field in enumerate(map(cls._meta.get_field, _TO_DOC_FIELDS))
+            if isinstance(field, MoneyCentsField)
+        ]
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            def flush():
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+                buffer.seek(0)
+                buffer.truncate()
+
+            for document in documents:
+                # значения берутся по именам в порядке _TO_DOC_FIELDS, как и колонки COPY; None записывается пустым
+                # значением без кавычек, что для COPY CSV означает NULL
+                values = list(_TO_DOC_ITEMS(build_document_kwargs(document)))
+                for index, field in money_fields:
+                    values[index] = field.get_prep_value(values[index])
+                for index, value in overrides:
+                    values[index] = value
+                writer.writerow(values + extra_values)
+
+                count += 1
+                if not count % chunk_size:
+                    flush()
+
+            if count % chunk_size:
+                flush()
+
+        return count
+
+    @classmethod
+    def bulk_to_documents(cls, queryset) -> List[Document]:
+        """
+        Платежные документы из выборки модели, выборка читается частями без кэширования всего результата
+
+        :param queryset: выборка объектов модели
+        :return: список платежных документов
+        """
+        return [obj.to_document() for obj in queryset.iterator(chunk_size=2000)]
+
+    @classmethod
+    def iter_documents(cls, queryset) -> Iterator[Document]:
+        """
+        Платежные документы из выборки модели без создания объектов модели: строки читаются через values_list
+        частями по 2000
+
+        :param queryset: выборка объектов модели
+        :return: итератор платежных документов
+        """
+        for values in queryset.values_list(*_TO_DOC_FIELDS).iterator(chunk_size=2000):
+            yield document_from_values(values)
+
+    @classmethod
+    def from_values_dict(cls, values: dict) -> Document:
+        """
+        Платежный документ из строки выборки values() без создания объекта модели
+
+        :param values: словарь {поле модели: значение}, должен содержать все поля документа
+        :return: платежный документ
+        """
+        return document_from_values(_TO_DOC_ITEMS(values))
 
-    # noinspection PyTypeChecker
     def to_document(self):
-        return Document(
-            document_type=self.document_type,
-            number=self.number,
-            date=self.date,
-            amount=self.amount,
-            receipt=Receipt(
-                date=self.receipt_date,
-                time=self.receipt_time,
-                content=self.receipt_content,
-            ),
-            payer=Payer(
-                account=self.payer_account,
-                date_charged=self.payer_date_charged,
-                name=self.payer_name,
-                inn=self.payer_inn,
-                l1_name=self.payer_l1_name,
-                l2_account_number=self.payer_l2_account_number,
-                l3_bank=self.payer_l3_bank,
-                l4_city=self.payer_l4_city,
-                account_number=self.payer_account_number,
-                bank_1_name=self.payer_bank_1_name,
-                bank_2_city=self.payer_bank_2_city,
-                bank_bic=self.payer_bank_bic,
-                bank_corr_account=self.payer_bank_corr_account,
-            ),
-            receiver=Receiver(
-                account=self.receiver_account,
-                date_received=self.receiver_date_received,
-                name=self.receiver_name,
-                inn=self.receiver_inn,
-                l1_name=self.receiver_l1_name,
-                l2_account_number=self.receiver_l2_account_number,
-                l3_bank=self.receiver_l3_bank,
-                l4_city=self.receiver_l4_city,
-                account_number=self.receiver_account_number,
-                bank_1_name=self.receiver_bank_1_name,
-                bank_2_city=self.receiver_bank_2_city,
-                bank_bic=self.receiver_bank_bic,
-                bank_corr_account=self.receiver_bank_corr_account,
-            ),
-            payment=Payment(
-                payment_type=self.payment_payment_type,
-                operation_type=self.payment_operation_type,
-                code=self.payment_code,
-                purpose=self.payment_purpose,
-                purpose_l1=self.payment_purpose_l1,
-                purpose_l2=self.payment_purpose_l2,
-                purpose_l3=self.payment_purpose_l3,
-                purpose_l4=self.payment_purpose_l4,
-                purpose_l5=self.payment_purpose_l5,
-                purpose_l6=self.payment_purpose_l6,
-            ),
-            tax=Tax(
-                originator_status=self.tax_originator_status,
-                payer_kpp=self.tax_payer_kpp,
-                receiver_kpp=self.tax_receiver_kpp,
-                kbk=self.tax_kbk,
-                okato=self.tax_okato,
-                basis=self.tax_basis,
-                period=self.tax_period,
-                number=self.tax_number,
-                date=self.tax_date,
-                type=self.tax_type,
-            ),
-            special=Special(
-                priority=self.special_priority,
-                term_of_acceptance=self.special_term_of_acceptance,
-                letter_of_credit_type=self.special_letter_of_credit_type,
-                maturity=self.special_maturity,
-                payment_condition_1=self.special_payment_condition_1,
-                payment_condition_2=self.special_payment_condition_2,
-                payment_condition_3=self.special_payment_condition_3,
-                by_submission=self.special_by_submission,
-                extra_conditions=self.special_extra_conditions,
-                supplier_account_number=self.special_supplier_account_number,
-                docs_sent_date=self.special_docs_sent_date
-            )
-        )
+        return document_from_values(_TO_DOC_GET(self))
+
+    def save_changed(self, changed_fields: Iterable[str]):
+        """
+        Сохраняет только перечисленные поля: UPDATE без остальных ~60 колонок
+
+        :param changed_fields: имена измененных полей
+        """
+        self.save(update_fields=list(changed_fields))
+
+    def update_purpose_lines(self, **kwargs):
+        """
+        Изменяет назначение платежа и сохраняет только измененные поля
+
+        :param kwargs: новые значения полей payment_purpose, payment_purpose_l1 ... payment_purpose_l6
+        """
+        unknown = [name for name in kwargs if name not in PURPOSE_FIELDS]
+        if unknown:
+            raise ValueError(f'Поля {", ".join(unknown)} не относятся к назначению платежа')
+
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        self.save_changed(kwargs)
@@ -3,7 +3,36 @@
 
 """The setup script."""
 
-from setuptools import setup, find_packages
+import os
+
+from setuptools import Extension, setup, find_packages
+
+# необязательные C-расширения, у каждого есть pure-Python реализация в пакете
+EXTENSIONS = ['client_bank_exchange_1c._fastparse', 'client_bank_exchange_1c._fast_convert']
+
+
+def get_ext_modules():
+    """
+    Расширения собираются из .pyx при наличии Cython, иначе из .c, сгенерированных Cython при сборке sdist.
+    Без исходников или компилятора пакет ставится с pure-Python реализацией
+    """
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        cythonize = None
+
+    ext_modules = []
+    for name in EXTENSIONS:
+        path = name.replace('.', '/')
+        if cythonize and os.path.exists(path + '.pyx'):
+            ext_modules.extend(cythonize([Extension(name, [path + '.pyx'])], language_level=3))
+        elif os.path.exists(path + '.c'):
+            ext_modules.append(Extension(name, [path + '.c']))
+
+    for extension in ext_modules:
+        extension.optional = True
+    return ext_modules
+
 
 # with open('README.rst') as readme_file:
 #     readme = readme_file.read()
@@ -34,6 +63,11 @@ setup(
     packages=find_packages(include=['client_bank_exchange_1c']),
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        'fast': ['cython>=3'],
+        'django': ['Django>=3.2'],
+    },
+    ext_modules=get_ext_modules(),
     license="GNU General Public License v3",
     zip_safe=False,
     keywords='client_bank_exchange_1c',